@@ -0,0 +1,11 @@
+#!/usr/bin/python3
+
+import sys
+
+sys.path.append('../src')
+
+import image_label_server.import_csv as ilsi
+
+
+stats = ilsi.import_csv_to_db("~/.config/image-label-server/sqlite_dbs/ber2024-body.db", "some_name.csv", overwrite=False, dry_run=True)
+print(stats)
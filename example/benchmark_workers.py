@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+# Benchmark of requests/sec of image-label-server with 1, 2, 4 and 8 reader processes.
+# It creates a temporary dataset and config, starts the server for each number of workers
+# and sends a mix of /obtain (80%), /size (10%) and /classify (10%) requests.
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import subprocess
+import threading
+import multiprocessing
+import requests
+from requests.auth import HTTPBasicAuth
+from PIL import Image
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+USER_DATA = {"user": "bench", "password": "bench"}
+DATASET_NAME = "bench"
+LABELS = ["positive", "negative", "neutral"]
+
+
+def create_environment(root, num_images):
+    image_dir = os.path.join(root, "images")
+    for sub in ("images", "json_data", "sqlite_dbs", "json_users"):
+        os.makedirs(os.path.join(root, sub))
+
+    for i in range(num_images):
+        Image.new('RGB', (224, 224), (i % 256, 0, 0)).save(os.path.join(image_dir, f"{i}.png"))
+
+    with open(os.path.join(root, "json_data", "bench.json"), 'w') as f:
+        json.dump({ "dataset_name": DATASET_NAME,
+                    "labels": LABELS,
+                    "base_dir": image_dir,
+                    "samples": [{"filepath": f"{i}.png", "label": ""} for i in range(num_images)]}, f)
+
+    with open(os.path.join(root, "json_users", "bench.json"), 'w') as f:
+        json.dump(USER_DATA, f)
+
+    config_path = os.path.join(root, "config.json")
+    with open(config_path, 'w') as f:
+        json.dump({ "json_db_dir": os.path.join(root, "json_data"),
+                    "sqlite_db_dir": os.path.join(root, "sqlite_dbs"),
+                    "json_user_dir": os.path.join(root, "json_users")}, f)
+    return config_path
+
+def wait_port(port, timeout=30):
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def client_process(base_url, num_images, duration, threads):
+    auth = HTTPBasicAuth(USER_DATA["user"], USER_DATA["password"])
+    counts = {"ok": 0, "errors": 0}
+    lock = threading.Lock()
+    end = time.time() + duration
+
+    def run():
+        session = requests.Session()
+        ok, errors = 0, 0
+        while time.time() < end:
+            r = random.random()
+            i = random.randrange(num_images)
+            try:
+                if r < 0.8:
+                    res = session.post(f"{base_url}/obtain", json={"dataset_name": DATASET_NAME, "id": i}, auth=auth)
+                elif r < 0.9:
+                    res = session.post(f"{base_url}/size", json={"dataset_name": DATASET_NAME}, auth=auth)
+                else:
+                    res = session.post(f"{base_url}/classify", json={"dataset_name": DATASET_NAME, "base_dir": "",
+                                                                     "filepath": f"{i}.png", "label": random.choice(LABELS)}, auth=auth)
+                if res.status_code == 200:
+                    ok += 1
+                else:
+                    errors += 1
+            except requests.RequestException:
+                errors += 1
+        with lock:
+            counts["ok"] += ok
+            counts["errors"] += errors
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return counts
+
+def benchmark(config_path, workers, port, num_images, duration, clients, threads):
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    server = subprocess.Popen([sys.executable, "-m", "image_label_server.server", "--config", config_path,
+                               "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_port(port):
+            raise RuntimeError("The server did not start")
+        base_url = f"http://127.0.0.1:{port}"
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.starmap(client_process, [(base_url, num_images, duration, threads)] * clients)
+    finally:
+        server.terminate()
+        server.wait()
+    ok = sum(r["ok"] for r in results)
+    errors = sum(r["errors"] for r in results)
+    return ok / duration, errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of image-label-server with several reader processes.")
+    parser.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Numbers of reader processes')
+    parser.add_argument('-d', '--duration', type=float, default=10, help='Seconds of load per configuration')
+    parser.add_argument('-c', '--clients', type=int, default=4, help='Number of client processes')
+    parser.add_argument('-t', '--threads', type=int, default=8, help='Number of threads per client process')
+    parser.add_argument('-n', '--images', type=int, default=200, help='Number of images of the dataset')
+    parser.add_argument('-p', '--port', type=int, default=45555, help='First port used by the servers')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        config_path = create_environment(root, args.images)
+        print(f"cpus={os.cpu_count()} clients={args.clients}x{args.threads} duration={args.duration}s")
+        print("workers  requests/sec  errors")
+        for k, workers in enumerate(args.workers):
+            rps, errors = benchmark(config_path, workers, args.port + k, args.images, args.duration, args.clients, args.threads)
+            print(f"{workers:7d}  {rps:12.1f}  {errors:6d}")
+
+if __name__ == "__main__":
+    main()
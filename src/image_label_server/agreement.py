@@ -0,0 +1,248 @@
+import sqlite3
+import numpy as np
+
+from image_label_server.votes import is_reserved_user
+
+
+def _count_keys(keys, size):
+    """
+    Counts the occurrences of the integer keys in [0, size). Returns (unique keys, counts).
+    A dense bincount is used when the key space is small, otherwise a sort.
+    """
+    if size <= (1 << 24):
+        counts = np.bincount(keys, minlength=size)
+        present = np.flatnonzero(counts)
+        return present, counts[present]
+    return np.unique(keys, return_counts=True)
+
+def _pairwise_cohen_kappa(sample_idx, user_idx, votes, num_users, num_labels):
+    """
+    Cohen's kappa of every pair of users that voted on common samples, computed in one pass.
+
+    The votes are sorted by (sample, user) and every two votes of the same sample form a pair
+    (i < j). Each pair of votes is encoded as the key ((i * U + j) * L + a) * L + b, and the
+    counts of the keys give the confusion matrix of every pair of users at once.
+
+    Returns (pairs, samples, kappas): the (i, j) user codes, the number of common samples and
+    the kappa of each pair (NaN when undefined).
+    """
+    order = np.lexsort((user_idx, sample_idx))
+    s, u, v = sample_idx[order], user_idx[order], votes[order]
+    keys = []
+    for d in range(1, s.size):
+        same = s[d:] == s[:-d]
+        if not same.any():
+            break
+        i, j = u[:-d][same], u[d:][same]
+        keys.append(((i * num_users + j) * num_labels + v[:-d][same]) * num_labels + v[d:][same])
+    size = num_users * num_users * num_labels * num_labels
+    if not keys:
+        return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    present, counts = _count_keys(np.concatenate(keys), size)
+
+    pair_id, cell = np.divmod(present, num_labels * num_labels)
+    pair_ids, pair_pos = np.unique(pair_id, return_inverse=True)
+    confusion = np.zeros((pair_ids.size, num_labels * num_labels), dtype=np.int64)
+    confusion[pair_pos, cell] = counts
+    confusion = confusion.reshape(-1, num_labels, num_labels)
+
+    n = confusion.sum(axis=(1, 2))
+    po = np.trace(confusion, axis1=1, axis2=2) / n
+    pe = (confusion.sum(axis=2) * confusion.sum(axis=1)).sum(axis=1) / (n * n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kappas = np.where(pe < 1.0, (po - pe) / (1.0 - pe), np.nan)
+    pairs = np.stack(np.divmod(pair_ids, num_users), axis=1)
+    return pairs, n, kappas
+
+def _fleiss_kappa(counts):
+    """
+    Fleiss' kappa of a (samples x labels) matrix of vote counts. Samples with fewer than
+    two votes are ignored and the number of raters may differ between samples.
+    Returns None when it is undefined.
+    """
+    n_i = counts.sum(axis=1)
+    counts = counts[n_i >= 2]
+    n_i = n_i[n_i >= 2]
+    if n_i.size == 0:
+        return None
+    p_i = ((counts * counts).sum(axis=1) - n_i) / (n_i * (n_i - 1))
+    p_bar = p_i.mean()
+    p_j = counts.sum(axis=0) / n_i.sum()
+    pe = np.dot(p_j, p_j)
+    if pe >= 1.0:
+        return None
+    return float((p_bar - pe) / (1.0 - pe))
+
+def compute_agreement(db_path, chunk_size=100000):
+    """
+    Computes inter-annotator agreement statistics of a multi-annotator SQLite dataset.
+
+    All votes are loaded once into NumPy arrays and every statistic is computed with batched
+    array operations, so the report scales to millions of votes.
+
+    Parameters:
+    - db_path (str): The path to the SQLite database file. It must contain the 'votes' table.
+    - chunk_size (int): The number of rows fetched from the database at a time.
+
+    Returns:
+    - dict: A dictionary with the following keys:
+        - "labels": The list of labels of the dataset.
+        - "num_votes", "num_samples", "num_users": Totals over the votes of the annotators.
+        - "confusion": A symmetric matrix that counts, over every pair of votes of different users
+                       on the same sample, how often the labels i and j were given together.
+        - "per_label": For each label, the number of samples (with at least two votes) with that
+                       consensus, and the specific agreement confusion[j][j] / sum(confusion[j]).
+        - "fleiss_kappa": Fleiss' kappa over the samples with at least two votes.
+        - "cohen_kappa": The pairwise Cohen's kappa of every pair of users with common samples,
+                         and their mean weighted by the number of common samples.
+        - "per_user": For each user, the number of votes, the number of votes compared (samples with
+                      at least two votes) and the accuracy against the consensus of the other voters.
+        - "reserved_users": For each pseudo-user named like `__name__` (the labels kept when the
+                      multi-annotator mode was enabled, CSV imports, model pre-labels...), the number
+                      of votes, the number of votes on samples voted by annotators and the accuracy
+                      against the consensus of those annotators.
+
+    Samples with a single vote only count in the totals: they carry no agreement information.
+    The votes of the reserved pseudo-users count toward the consensus stored in 'samples', but
+    they are not annotators, so they are left out of every other statistic.
+
+    Raises:
+    - sqlite3.DatabaseError: If there are any issues with database access or queries.
+    """
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+
+    c.execute('SELECT label FROM labels')
+    labels = [row[0] for row in c.fetchall()]
+    num_labels = len(labels)
+    label_code = {label: j for j, label in enumerate(labels)}
+
+    # Anotadores primeiro; os pseudo-usuários reservados (__legacy__, __import__...) ficam com os últimos códigos
+    c.execute('SELECT DISTINCT user FROM votes ORDER BY user')
+    all_users = [row[0] for row in c.fetchall()]
+    user_names = [user for user in all_users if not is_reserved_user(user)]
+    reserved_names = [user for user in all_users if is_reserved_user(user)]
+    num_users = len(user_names)
+    user_code = {user: k for k, user in enumerate(user_names + reserved_names)}
+
+    # Votos convertidos em códigos inteiros; -1 para rótulos fora da tabela labels (ou sem consenso)
+    c.execute('SELECT v.sample_id, v.user, v.label, s.label FROM votes v JOIN samples s ON s.rowid = v.sample_id')
+    sample_ids, user_idx, votes, consensus = [], [], [], []
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            break
+        sample_ids.append(np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+        user_idx.append(np.fromiter((user_code[row[1]] for row in rows), dtype=np.int64, count=len(rows)))
+        votes.append(np.fromiter((label_code.get(row[2], -1) for row in rows), dtype=np.int64, count=len(rows)))
+        consensus.append(np.fromiter((label_code.get(row[3], -1) for row in rows), dtype=np.int64, count=len(rows)))
+    conn.close()
+
+    empty = np.zeros(0, dtype=np.int64)
+    sample_ids = np.concatenate(sample_ids) if sample_ids else empty
+    user_idx = np.concatenate(user_idx) if user_idx else empty
+    votes = np.concatenate(votes) if votes else empty
+    consensus = np.concatenate(consensus) if consensus else empty
+
+    known = votes >= 0
+    sample_ids, user_idx, votes, consensus = sample_ids[known], user_idx[known], votes[known], consensus[known]
+
+    # Votos dos pseudo-usuários reservados, separados dos votos dos anotadores
+    reserved = user_idx >= num_users
+    reserved_samples, reserved_users, reserved_votes = sample_ids[reserved], user_idx[reserved] - num_users, votes[reserved]
+    human = ~reserved
+    sample_ids, user_idx, votes, consensus = sample_ids[human], user_idx[human], votes[human], consensus[human]
+
+    unique_ids, sample_idx = np.unique(sample_ids, return_inverse=True)
+    num_samples = int(sample_idx.max()) + 1 if sample_idx.size else 0
+
+    report = {
+        "labels": labels,
+        "num_votes": int(votes.size),
+        "num_samples": num_samples,
+        "num_users": num_users
+    }
+
+    # Matriz amostras x rótulos com o número de votos; só amostras com 2+ votos entram nas estatísticas
+    counts = np.bincount(sample_idx * num_labels + votes, minlength=num_samples * num_labels).reshape(num_samples, num_labels)
+    num_votes = counts.sum(axis=1)
+    multi = num_votes[sample_idx] >= 2
+
+    # Matriz de confusão: pares de votos de usuários diferentes na mesma amostra
+    confusion = counts.T @ counts - np.diag(counts.sum(axis=0))
+    report["confusion"] = confusion.tolist()
+
+    # Número de amostras (com 2+ votos) por rótulo de consenso e concordância específica de cada rótulo
+    first_vote = np.unique(sample_idx, return_index=True)[1]
+    cons_per_sample = consensus[first_vote][num_votes >= 2]
+    samples_per_label = np.bincount(cons_per_sample[cons_per_sample >= 0], minlength=num_labels)
+    pairs_per_label = confusion.sum(axis=1)
+    report["per_label"] = {
+        label: {
+            "samples": int(samples_per_label[j]),
+            "agreement": float(confusion[j, j] / pairs_per_label[j]) if pairs_per_label[j] else None
+        }
+        for j, label in enumerate(labels)
+    }
+
+    # Fleiss' kappa sobre a matriz amostras x rótulos
+    report["fleiss_kappa"] = _fleiss_kappa(counts)
+
+    # Cohen's kappa para cada par de usuários
+    pairs, pair_samples, kappas = _pairwise_cohen_kappa(sample_idx, user_idx, votes, num_users, num_labels)
+    defined = ~np.isnan(kappas)
+    report["cohen_kappa"] = {
+        "mean": float(np.average(kappas[defined], weights=pair_samples[defined])) if defined.any() else None,
+        "pairs": [
+            {
+                "users": [user_names[i], user_names[j]],
+                "samples": int(n),
+                "kappa": float(k) if not np.isnan(k) else None
+            }
+            for (i, j), n, k in zip(pairs.tolist(), pair_samples, kappas)
+        ]
+    }
+
+    # Acurácia de cada usuário contra o consenso dos outros votantes da mesma amostra.
+    # Em empates entre k rótulos, um voto em um deles conta 1/k.
+    other = counts[sample_idx[multi]]
+    user_votes_m, votes_m = user_idx[multi], votes[multi]
+    rows = np.arange(votes_m.size)
+    other[rows, votes_m] -= 1
+    top = other == other.max(axis=1, keepdims=True)
+    credit = top[rows, votes_m] / top.sum(axis=1)
+    user_votes = np.bincount(user_idx, minlength=num_users)
+    user_compared = np.bincount(user_votes_m, minlength=num_users)
+    user_hits = np.bincount(user_votes_m, weights=credit, minlength=num_users)
+    report["per_user"] = {
+        user: {
+            "votes": int(user_votes[k]),
+            "compared": int(user_compared[k]),
+            "accuracy": float(user_hits[k] / user_compared[k]) if user_compared[k] else None
+        }
+        for k, user in enumerate(user_names)
+    }
+
+    # Acurácia de cada pseudo-usuário reservado contra o consenso dos anotadores da amostra
+    pos = np.searchsorted(unique_ids, reserved_samples)
+    found = pos < unique_ids.size
+    found[found] = unique_ids[pos[found]] == reserved_samples[found]
+    annotators = counts[pos[found]]
+    votes_r = reserved_votes[found]
+    rows = np.arange(votes_r.size)
+    top = annotators == annotators.max(axis=1, keepdims=True)
+    credit = top[rows, votes_r] / top.sum(axis=1)
+    num_reserved = len(reserved_names)
+    reserved_total = np.bincount(reserved_users, minlength=num_reserved)
+    reserved_compared = np.bincount(reserved_users[found], minlength=num_reserved)
+    reserved_hits = np.bincount(reserved_users[found], weights=credit, minlength=num_reserved)
+    report["reserved_users"] = {
+        user: {
+            "votes": int(reserved_total[k]),
+            "compared": int(reserved_compared[k]),
+            "accuracy": float(reserved_hits[k] / reserved_compared[k]) if reserved_compared[k] else None
+        }
+        for k, user in enumerate(reserved_names)
+    }
+
+    return report
@@ -195,6 +195,102 @@ def classify_sample(base_url,user_data, image_data):
     }, auth=HTTPBasicAuth(user_data["user"],user_data["password"]))
     return response.json()
 
+def import_csv(base_url, user_data, dataset_name, csv_path, overwrite=True, dry_run=False, vote_user=None):
+    """
+    Uploads a CSV file, in the format written by image-label-export-csv, to import its labels into a dataset.
+
+    Parameters:
+    -----------
+    base_url : str
+        The base URL of the server, e.g. 'http://localhost:44444'.
+        
+    user_data : dict
+        A dictionary with the keys "user" and "password" used for HTTP Basic Authentication.
+        
+    dataset_name : str
+        The name of the dataset that receives the labels.
+        
+    csv_path : str
+        The path of the CSV file with the columns filepath and label.
+        
+    overwrite : bool
+        If True, existing labels are replaced. If False, only samples without label are filled.
+        
+    dry_run : bool
+        If True, the server only reports how many samples would change.
+        
+    vote_user : str or None
+        In multi-annotator datasets, the user that receives the imported labels as votes.
+        It must be the authenticated user or a reserved name like "__import__".
+        If None, the server default "__import__" is used.
+
+    Returns:
+    --------
+    dict
+        The JSON response from the server with the counters "rows", "changed", "unchanged",
+        "empty_label", "invalid_label" and "not_found".
+    """
+    form = {"dataset_name": dataset_name, "overwrite": str(overwrite).lower(), "dry_run": str(dry_run).lower()}
+    if vote_user is not None:
+        form["vote_user"] = vote_user
+    with open(csv_path, 'rb') as csvfile:
+        response = requests.post(   f"{base_url}/import_csv", 
+                                    data=form,
+                                    files={"file": csvfile},
+                                    auth=HTTPBasicAuth(user_data["user"],user_data["password"]))
+    return response.json()
+
+def get_agreement(base_url, user_data, dataset_name):
+    """
+    Retrieves the inter-annotator agreement report of a dataset in multi-annotator mode.
+
+    Parameters:
+    -----------
+    base_url : str
+        The base URL of the server, e.g. 'http://localhost:44444'.
+        
+    user_data : dict
+        A dictionary with the keys "user" and "password" used for HTTP Basic Authentication.
+        
+    dataset_name : str
+        The name of the dataset.
+
+    Returns:
+    --------
+    dict
+        The JSON response from the server with the keys "labels", "num_votes", "num_samples",
+        "num_users", "confusion", "per_label", "fleiss_kappa", "cohen_kappa" and "per_user".
+        If the dataset is not in multi-annotator mode, a dictionary with a "message" key.
+    """
+    response = requests.post(   f"{base_url}/agreement", 
+                                json={"dataset_name": dataset_name}, 
+                                auth=HTTPBasicAuth(user_data["user"],user_data["password"]))
+    return response.json()
+
+def get_cache_stats(base_url, user_data):
+    """
+    Retrieves the statistics of the server-side image cache.
+
+    Parameters:
+    -----------
+    base_url : str
+        The base URL of the server, e.g. 'http://localhost:44444'.
+        
+    user_data : dict
+        A dictionary with the keys "user" and "password" used for HTTP Basic Authentication.
+
+    Returns:
+    --------
+    dict
+        The JSON response from the server. When the cache is enabled it contains
+        "max_bytes", "used_bytes", "items", "hits", "misses", "hit_rate", "evictions",
+        "prefetched", "prefetch_hits" and "processes"; otherwise {"enabled": False}.
+        In multi-process mode the values are the sum over all the reader processes.
+    """
+    response = requests.post(   f"{base_url}/cache_stats", 
+                                auth=HTTPBasicAuth(user_data["user"],user_data["password"]))
+    return response.json()
+
 ################################################################################
 
 def main():
@@ -206,6 +302,12 @@ image-label-client -u MYUSER -p MYPASSWORD -b "http://127.0.0.1:44444" -d DATASE
 image-label-client -u MYUSER -p MYPASSWORD -b "http://127.0.0.1:44444" -d DATASET_NAME obtain --id 0
 
 image-label-client -u MYUSER -p MYPASSWORD -b "http://127.0.0.1:44444" -d DATASET_NAME classify --basedir BASEDIR --filepath FILEPATH --label LABEL
+
+image-label-client -u MYUSER -p MYPASSWORD -b "http://127.0.0.1:44444" -d DATASET_NAME cache
+
+image-label-client -u MYUSER -p MYPASSWORD -b "http://127.0.0.1:44444" -d DATASET_NAME agreement
+
+image-label-client -u MYUSER -p MYPASSWORD -b "http://127.0.0.1:44444" -d DATASET_NAME import --csv FILE.csv --dry-run
     '''
     # Inicializa o parser
     parser = argparse.ArgumentParser(
@@ -260,6 +362,19 @@ image-label-client -u MYUSER -p MYPASSWORD -b "http://127.0.0.1:44444" -d DATASE
     classify_parser.add_argument('-f', '--filepath', help='File path of sample in the dataset',type=str, required=True)
     classify_parser.add_argument('-l', '--label', help='Label of sample in the dataset',type=str, required=True)
     
+    # Subcomando cache
+    cache_parser = subparsers.add_parser('cache', help='Statistics of the server image cache')
+    
+    # Subcomando agreement
+    agreement_parser = subparsers.add_parser('agreement', help='Inter-annotator agreement of dataset')
+    
+    # Subcomando import
+    import_parser = subparsers.add_parser('import', help='Import the labels of a csv file into the dataset')
+    import_parser.add_argument('-c', '--csv', help='Path of the csv file (format of image-label-export-csv)',type=str, required=True)
+    import_parser.add_argument('-e', '--only-empty', help='Only fill samples without label',action='store_true')
+    import_parser.add_argument('-n', '--dry-run', help='Only report how many samples would change',action='store_true')
+    import_parser.add_argument('--vote-user', help='User that receives the imported labels as votes (multi-annotator datasets)',type=str, default=None)
+    
     ####################################
     # Faz o parsing dos argumentos
     args = parser.parse_args()
@@ -277,6 +392,18 @@ image-label-client -u MYUSER -p MYPASSWORD -b "http://127.0.0.1:44444" -d DATASE
     elif args.command == 'classify':
         res_json=classify_sample(args.base, {"user":args.user,"password":args.password}, {"dataset_name":args.dataset,"base_dir":args.basedir,"filepath":args.filepath,"label":args.label})
         print(res_json)
+        
+    elif args.command == 'cache':
+        res_json=get_cache_stats(args.base, {"user":args.user,"password":args.password})
+        print(res_json)
+        
+    elif args.command == 'agreement':
+        res_json=get_agreement(args.base, {"user":args.user,"password":args.password}, args.dataset)
+        print(json.dumps(res_json, indent=4))
+        
+    elif args.command == 'import':
+        res_json=import_csv(args.base, {"user":args.user,"password":args.password}, args.dataset, args.csv, overwrite=not args.only_empty, dry_run=args.dry_run, vote_user=args.vote_user)
+        print(res_json)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,219 @@
+import zlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Contadores de um cache, na ordem em que são guardados no vetor de contadores
+CACHE_COUNTERS = ["used_bytes", "items", "hits", "misses", "evictions", "prefetched", "prefetch_hits"]
+USED_BYTES, ITEMS, HITS, MISSES, EVICTIONS, PREFETCHED, PREFETCH_HITS = range(len(CACHE_COUNTERS))
+
+
+def combined_stats(counters, num_caches, max_bytes):
+    """
+    Returns the statistics of `num_caches` caches of `max_bytes` each, whose counters are stored
+    one after the other in `counters` (for example a multiprocessing.RawArray shared by the
+    reader processes). Counters are summed and the hit rate is computed over all the caches.
+    """
+    totals = [0] * len(CACHE_COUNTERS)
+    for k in range(num_caches):
+        for i in range(len(CACHE_COUNTERS)):
+            totals[i] += counters[k * len(CACHE_COUNTERS) + i]
+    stats = dict(zip(CACHE_COUNTERS, totals))
+    requests = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["hits"] / requests) if requests else 0.0
+    stats["max_bytes"] = max_bytes * num_caches
+    stats["processes"] = num_caches
+    return stats
+
+
+class ImageCache:
+    """
+    Thread-safe in-memory LRU cache of image file contents, bounded by a total byte budget.
+
+    The cache is keyed by the absolute path of the image. When inserting a new entry would
+    exceed the byte budget, the least recently used entries are evicted until it fits.
+    Files larger than the whole budget are never cached.
+
+    Parameters:
+    - max_bytes (int): The maximum number of bytes held in memory. A value of 0 disables the cache.
+    - counters (list or multiprocessing.RawArray): Optional storage of the counters. The cache
+                 uses the len(CACHE_COUNTERS) positions starting at `offset`, so several processes
+                 can publish their counters in one shared array (see `combined_stats`).
+    - offset (int): The first position of this cache in `counters`.
+    """
+    def __init__(self, max_bytes, counters=None, offset=0):
+        self.max_bytes = max(0, int(max_bytes))
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = counters if counters is not None else [0] * len(CACHE_COUNTERS)
+        self._offset = offset
+        # Um cache novo começa vazio, mesmo reutilizando as posições de um processo anterior
+        self._counters[offset + USED_BYTES] = 0
+        self._counters[offset + ITEMS] = 0
+        self._prefetched_keys = set()
+        self.prefetcher = None
+
+    def _add(self, counter, n=1):
+        self._counters[self._offset + counter] += n
+
+    def get(self, key):
+        """
+        Returns the cached bytes for `key` or None, updating the LRU order and hit/miss counters.
+        """
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                self._add(MISSES)
+                return None
+            self._data.move_to_end(key)
+            self._add(HITS)
+            if key in self._prefetched_keys:
+                self._prefetched_keys.discard(key)
+                self._add(PREFETCH_HITS)
+            return data
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._data
+
+    def put(self, key, data, prefetched=False):
+        """
+        Stores `data` under `key`, evicting least recently used entries if needed.
+        Returns True if the data was stored.
+        """
+        size = len(data)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._add(USED_BYTES, -len(old))
+            while self._data and self._counters[self._offset + USED_BYTES] + size > self.max_bytes:
+                old_key, old_data = self._data.popitem(last=False)
+                self._add(USED_BYTES, -len(old_data))
+                self._prefetched_keys.discard(old_key)
+                self._add(EVICTIONS)
+            self._data[key] = data
+            self._add(USED_BYTES, size)
+            self._counters[self._offset + ITEMS] = len(self._data)
+            if prefetched:
+                self._add(PREFETCHED)
+                self._prefetched_keys.add(key)
+        return True
+
+    def read(self, path):
+        """
+        Returns the contents of the file at `path`, served from the cache when possible
+        and inserted into the cache after a miss. If the image is being loaded by the
+        prefetcher, it waits for that load instead of reading the file a second time.
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.wait(path)
+        data = self.get(path)
+        if data is not None:
+            return data
+        with open(path, 'rb') as img_file:
+            data = img_file.read()
+        self.put(path, data)
+        return data
+
+    def stats(self):
+        """
+        Returns a dictionary with the hit rate and memory use of the cache.
+        """
+        with self._lock:
+            counters = [self._counters[self._offset + i] for i in range(len(CACHE_COUNTERS))]
+        return combined_stats(counters, 1, self.max_bytes)
+
+
+class Prefetcher:
+    """
+    Loads images into an ImageCache ahead of time using a pool of background threads.
+
+    The server calls `schedule` after each `/obtain` with the image paths it predicts the
+    user will request next. Paths already cached or already being loaded are skipped.
+    The prefetcher registers itself in the cache, so `ImageCache.read` waits for the
+    images that are being loaded and cancels the ones still queued.
+
+    Parameters:
+    - cache (ImageCache): The cache that receives the prefetched images.
+    - workers (int): The number of threads used to read images from disk.
+    - claims (PrefetchClaims): Optional table shared with the prefetchers of other processes;
+                 a path claimed by another process is not prefetched again here.
+    """
+    def __init__(self, cache, workers=4, claims=None):
+        self.cache = cache
+        self.claims = claims
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)),
+                                            thread_name_prefix="image-prefetch")
+        self._pending = {}
+        self._lock = threading.Lock()
+        cache.prefetcher = self
+
+    def schedule(self, paths):
+        for path in paths:
+            if self.cache.contains(path):
+                continue
+            with self._lock:
+                if path in self._pending:
+                    continue
+                if self.claims is not None and not self.claims.claim(path):
+                    continue
+                self._pending[path] = self._executor.submit(self._load, path)
+
+    def wait(self, path):
+        """
+        Blocks until the prefetch of `path` finishes, if it is already running. A prefetch that
+        is still queued behind other reads is cancelled, so the caller reads the file directly.
+        """
+        with self._lock:
+            future = self._pending.get(path)
+            if future is not None and future.cancel():
+                # Cancelado antes de começar: _load não roda, então a entrada é removida aqui
+                self._pending.pop(path, None)
+                return
+        if future is not None:
+            future.result()
+
+    def _load(self, path):
+        try:
+            with open(path, 'rb') as img_file:
+                self.cache.put(path, img_file.read(), prefetched=True)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Prefetch of {path} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class PrefetchClaims:
+    """
+    Table shared by the prefetchers of several processes that records the paths recently
+    scheduled for prefetch, so each upcoming image is read ahead by only one process.
+
+    Each path is stored as its CRC32 in a slot chosen by the same hash; a path claimed by a
+    process is skipped by the others until its slot is reused by another path.
+
+    Parameters:
+    - slots (multiprocessing.Array): A synchronized array of integers created before the fork.
+    """
+    def __init__(self, slots):
+        self._slots = slots
+
+    def claim(self, path):
+        """
+        Returns True if `path` was not claimed yet, claiming it for the caller.
+        """
+        key = zlib.crc32(path.encode('utf-8')) + 1
+        i = key % len(self._slots)
+        with self._slots.get_lock():
+            if self._slots[i] == key:
+                return False
+            self._slots[i] = key
+        return True
@@ -0,0 +1,273 @@
+import os
+import sqlite3
+import csv
+import json
+import argparse
+from itertools import islice
+
+from image_label_server.votes import is_multi_annotator, save_vote
+
+# Número máximo de parâmetros por consulta "IN (...)" (limite antigo do SQLite é 999)
+MAX_SQL_PARAMS = 500
+
+# Usuário que recebe os votos importados em datasets multi-anotador
+IMPORT_USER = "__import__"
+
+IMPORT_COUNTERS = ["rows", "changed", "unchanged", "empty_label", "invalid_label", "not_found"]
+
+
+def _current_labels(c, filepaths, vote_user=None):
+    """
+    Returns a dictionary filepath -> (rowid, label, value) for the given filepaths that exist
+    in 'samples'. The value is the label itself, or the vote of `vote_user` in multi-annotator mode.
+    """
+    if vote_user is None:
+        query = 'SELECT filepath, rowid, label, label FROM samples WHERE filepath IN ({})'
+        extra = []
+    else:
+        query = '''SELECT s.filepath, s.rowid, s.label, v.label FROM samples s
+                   LEFT JOIN votes v ON v.sample_id = s.rowid AND v.user = ?
+                   WHERE s.filepath IN ({})'''
+        extra = [vote_user]
+    current = {}
+    for i in range(0, len(filepaths), MAX_SQL_PARAMS):
+        batch = filepaths[i:i + MAX_SQL_PARAMS]
+        c.execute(query.format(",".join("?" * len(batch))), extra + batch)
+        for filepath, rowid, label, value in c.fetchall():
+            current[filepath] = (rowid, label or "", value or "")
+    return current
+
+def new_import_stats(overwrite, dry_run):
+    stats = {key: 0 for key in IMPORT_COUNTERS}
+    stats["overwrite"] = overwrite
+    stats["dry_run"] = dry_run
+    return stats
+
+def add_import_stats(stats, part):
+    for key in IMPORT_COUNTERS:
+        stats[key] += part[key]
+
+def read_csv_chunks(csvfile, chunk_size=10000):
+    """
+    Yields the rows of a CSV file, in the format written by `export_db_to_csv`, in lists of
+    at most `chunk_size` rows. Blank lines are skipped.
+
+    Raises:
+    - ValueError: If the CSV header is not 'filepath,label'.
+    """
+    reader = csv.reader(csvfile)
+    header = next(reader, None)
+    if header != ['filepath', 'label']:
+        raise ValueError(f"Invalid CSV header {header}, expected ['filepath', 'label']")
+    while True:
+        chunk = list(islice(reader, chunk_size))
+        if not chunk:
+            break
+        chunk = [row for row in chunk if row]
+        if chunk:
+            yield chunk
+
+def import_csv_chunk(conn, rows, overwrite=True, dry_run=False, vote_user=IMPORT_USER, decided=None):
+    """
+    Imports one chunk of CSV rows without committing and returns its counters.
+
+    The rows are decided in order, so a filepath that repeats is compared with the label
+    given by its previous row. In a dry run nothing is written, so `decided` (filepath -> label)
+    carries those decisions between chunks; this keeps the counters of a dry run equal to the
+    ones of the real run. A real run does not need it: the previous chunks are already committed.
+    In multi-annotator datasets each label is stored as the vote of `vote_user`.
+    """
+    c = conn.cursor()
+    if decided is None:
+        decided = {}
+
+    # Índice em filepath para as consultas e atualizações por lote
+    if not dry_run:
+        c.execute('CREATE INDEX IF NOT EXISTS idx_samples_filepath ON samples (filepath)')
+
+    c.execute('SELECT label FROM labels')
+    valid_labels = set(row[0] for row in c.fetchall())
+    multi_annotator = is_multi_annotator(c)
+
+    # Validação em memória e consulta dos rótulos atuais por lote
+    filepaths = list(set(row[0] for row in rows if len(row) > 1 and row[1] in valid_labels))
+    current = _current_labels(c, filepaths, vote_user if multi_annotator else None)
+
+    stats = {key: 0 for key in IMPORT_COUNTERS}
+    updates = []
+    for row in rows:
+        stats["rows"] += 1
+        filepath, label = row[0], row[1] if len(row) > 1 else ""
+        if label == "":
+            stats["empty_label"] += 1
+        elif label not in valid_labels:
+            stats["invalid_label"] += 1
+        elif filepath not in current:
+            stats["not_found"] += 1
+        else:
+            rowid, sample_label, value = current[filepath]
+            if filepath in decided:
+                sample_label = value = decided[filepath]
+            if value == label or (not overwrite and sample_label):
+                stats["unchanged"] += 1
+            else:
+                stats["changed"] += 1
+                decided[filepath] = label
+                updates.append((rowid, filepath, label))
+
+    if not dry_run and updates:
+        if multi_annotator:
+            for rowid, filepath, label in updates:
+                save_vote(c, rowid, vote_user, label)
+        else:
+            c.executemany('UPDATE samples SET label = ? WHERE filepath = ?',
+                          [(label, filepath) for rowid, filepath, label in updates])
+    return stats
+
+def import_csv_rows(conn, csvfile, overwrite=True, dry_run=False, chunk_size=10000, vote_user=IMPORT_USER):
+    """
+    Imports labels from an open CSV file object using an open SQLite connection,
+    committing each chunk. See `import_csv_stream_to_db` for the parameters and the counters.
+    """
+    stats = new_import_stats(overwrite, dry_run)
+    # Só o dry run guarda as decisões entre blocos; no modo real elas já estão no banco
+    decided = {} if dry_run else None
+    for rows in read_csv_chunks(csvfile, chunk_size):
+        part = import_csv_chunk(conn, rows, overwrite=overwrite, dry_run=dry_run, vote_user=vote_user, decided=decided)
+        if not dry_run:
+            conn.commit()
+        add_import_stats(stats, part)
+    return stats
+
+def import_csv_stream_to_db(db_path, csvfile, overwrite=True, dry_run=False, chunk_size=10000, vote_user=IMPORT_USER):
+    """
+    Imports labels from an open CSV file object into the 'samples' table of a SQLite database.
+
+    The CSV must have the format written by `export_db_to_csv`: a header row 'filepath,label'
+    followed by one row per sample. The file is read in chunks of `chunk_size` rows, so it is
+    never loaded entirely in memory, and each chunk is applied in its own transaction.
+
+    Parameters:
+    - db_path (str): The path to the SQLite database file (with '~' expansion).
+    - csvfile (file object): A text file object opened with newline=''.
+    - overwrite (bool): If True, existing labels are replaced. If False, only samples
+                        without label are filled.
+    - dry_run (bool): If True, nothing is written and only the counters are computed.
+    - chunk_size (int): The number of CSV rows processed per transaction.
+    - vote_user (str): In multi-annotator datasets, the user that receives the imported labels
+                       as votes; the consensus is then updated as for any other vote. With
+                       overwrite=False only samples without consensus receive a vote.
+
+    Rows with an empty label are skipped (an import never clears labels), rows with a label
+    that is not in the 'labels' table are rejected, and rows with a filepath that is not in
+    the dataset are counted as not found. Each row is counted in exactly one of "changed",
+    "unchanged", "empty_label", "invalid_label" and "not_found". A dry run does not modify
+    the database at all.
+
+    Returns:
+    - dict: The counters "rows", "changed", "unchanged", "empty_label", "invalid_label",
+            "not_found" and the flags "overwrite" and "dry_run". In a dry run "changed" is the
+            number of samples that would change.
+
+    Raises:
+    - ValueError: If the CSV header is not 'filepath,label'.
+    - sqlite3.DatabaseError: If there are any issues with database access or queries.
+    """
+    db_path = os.path.expanduser(db_path);
+
+    conn = sqlite3.connect(db_path)
+    try:
+        return import_csv_rows(conn, csvfile, overwrite=overwrite, dry_run=dry_run, chunk_size=chunk_size, vote_user=vote_user)
+    finally:
+        conn.close()
+
+def import_csv_to_db(db_path, input_csv, overwrite=True, dry_run=False, chunk_size=10000, vote_user=IMPORT_USER):
+    """
+    Imports labels from a CSV file, in the format written by `export_db_to_csv`, into a SQLite database.
+
+    Parameters:
+    - db_path (str): The path to the SQLite database file (with '~' expansion).
+    - input_csv (str): The path to the CSV file with the filepath and label columns.
+    - overwrite (bool): If True, existing labels are replaced. If False, only samples
+                        without label are filled.
+    - dry_run (bool): If True, nothing is written and only the counters are computed.
+    - chunk_size (int): The number of CSV rows processed per transaction.
+    - vote_user (str): In multi-annotator datasets, the user that receives the imported labels as votes.
+
+    Returns:
+    - dict: The counters described in `import_csv_stream_to_db`.
+    """
+    input_csv = os.path.expanduser(input_csv);
+    with open(input_csv, 'r', newline='') as csvfile:
+        return import_csv_stream_to_db(db_path, csvfile, overwrite=overwrite, dry_run=dry_run, chunk_size=chunk_size, vote_user=vote_user)
+
+
+################################################################################
+
+def main():
+    EXAMPLE_USE='''
+Example of use:
+
+image-label-import-csv -i "some_name.csv" -o "~/.config/image-label-server/sqlite_dbs/ber2024-body.db" --dry-run
+
+image-label-import-csv -i "some_name.csv" -o "~/.config/image-label-server/sqlite_dbs/ber2024-body.db" --only-empty
+    '''
+
+    # Inicializa o parser
+    parser = argparse.ArgumentParser(
+        description="Program to import the labels of a csv file into the sqlite dataset.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=EXAMPLE_USE
+    )
+
+    # Adiciona os argumentos
+    parser.add_argument(
+        '-i', '--input',
+        type=str,
+        help='The path of input csv file (same format of image-label-export-csv)',
+        required=True
+    )
+
+    parser.add_argument(
+        '-o', '--output',
+        type=str,
+        help='The path of output SQLite dataset',
+        required=True
+    )
+
+    parser.add_argument(
+        '-e', '--only-empty',
+        action='store_true',
+        help='Only fill samples without label instead of overwriting existing labels'
+    )
+
+    parser.add_argument(
+        '-n', '--dry-run',
+        action='store_true',
+        help='Only report how many samples would change'
+    )
+
+    parser.add_argument(
+        '-u', '--vote-user',
+        type=str,
+        help='In multi-annotator datasets, the user that receives the imported labels as votes',
+        default=IMPORT_USER
+    )
+
+    parser.add_argument(
+        '-c', '--chunk-size',
+        type=int,
+        help='Number of csv rows processed per transaction',
+        default=10000
+    )
+
+    ####################################
+    # Faz o parsing dos argumentos
+    args = parser.parse_args()
+
+    stats = import_csv_to_db(args.output, args.input, overwrite=not args.only_empty, dry_run=args.dry_run, chunk_size=args.chunk_size, vote_user=args.vote_user)
+    print(json.dumps(stats, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,15 @@ from mimetypes import guess_type
 #from werkzeug.security import check_password_hash
 from pathlib import Path
 import sys
+import io
 import functools
+import argparse
+import multiprocessing
+from image_label_server.image_cache import ImageCache, Prefetcher, PrefetchClaims, CACHE_COUNTERS, combined_stats
+from image_label_server.agreement import compute_agreement
+from image_label_server.votes import init_votes_table, is_multi_annotator, is_reserved_user, save_vote
+from image_label_server.import_csv import import_csv_stream_to_db, import_csv_chunk, read_csv_chunks, new_import_stats, add_import_stats, IMPORT_USER
+from image_label_server.workers import serve_multiprocess
 
 # Configurações
 EX_USER_STRING="""
@@ -34,6 +42,15 @@ CONFIG_PATH = os.path.expanduser("~/.config/image-label-server/config.json")
 JSON_DB_DIR = None;
 SQLITE_DB_DIR = None;
 JSON_USER_DIR = None;
+IMAGE_CACHE = None;
+PREFETCHER = None;
+PREFETCH_DEPTH = 0;
+WRITER = None;
+SHARED_CACHE_COUNTERS = None;
+NUM_CACHES = 1;
+
+# Número de posições da tabela de leitura antecipada compartilhada pelos processos leitores
+PREFETCH_CLAIM_SLOTS = 4096
 
 app = Flask(__name__)
 
@@ -74,6 +91,7 @@ def init_sqlite_db(dataset_name, json_file):
     c.execute('''CREATE TABLE IF NOT EXISTS metadata (dataset_name TEXT, base_dir TEXT)''')
     c.execute('''CREATE TABLE IF NOT EXISTS labels (label TEXT)''')
     c.execute('''CREATE TABLE IF NOT EXISTS samples (filepath TEXT, label TEXT)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_samples_filepath ON samples (filepath)''')
     
     # Inserindo dados do JSON
     with open(json_file, 'r') as f:
@@ -83,10 +101,58 @@ def init_sqlite_db(dataset_name, json_file):
             c.execute('INSERT INTO labels VALUES (?)', (label,))
         for sample in data['samples']:
             c.execute('INSERT INTO samples VALUES (?, ?)', (sample['filepath'], sample['label']))
+        if data.get('multi_annotator', False):
+            init_votes_table(c)
     
     conn.commit()
     conn.close()
 
+def write_label(conn, filepath, label, user):
+    """
+    Writes the label of the sample `filepath` without committing. In multi-annotator mode the
+    label is stored as the vote of `user`. Returns False if `label` is not a label of the dataset.
+    """
+    c = conn.cursor()
+
+    c.execute('SELECT label FROM labels WHERE label = ?', (label,))
+    if not c.fetchone():
+        return False
+
+    if is_multi_annotator(c):
+        # Um voto por (amostra, usuário); a coluna label guarda o consenso
+        c.execute('SELECT rowid FROM samples WHERE filepath = ?', (filepath,))
+        for (sample_id,) in c.fetchall():
+            save_vote(c, sample_id, user, label)
+    else:
+        c.execute('UPDATE samples SET label = ? WHERE filepath = ?', (label, filepath))
+    return True
+
+# Tarefas de escrita; no modo multi-processo são executadas pelo processo escritor.
+# Uma importação de CSV é enviada como uma tarefa por bloco de linhas, para que as
+# escritas de /classify possam ser executadas entre os blocos.
+WRITE_TASKS = {
+    "write_label": write_label,
+    "write_csv_chunk": import_csv_chunk
+}
+
+WRITE_TIMEOUT_MESSAGE = "The writer process is busy and did not answer in time; the write may still be applied"
+
+def run_write(task_name, db_path, **kwargs):
+    """
+    Runs a write task of WRITE_TASKS on `db_path` and commits it, either in this process or,
+    in multi-process mode, in the single writer process.
+    """
+    if WRITER is not None:
+        return WRITER.submit(task_name, db_path, **kwargs)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        result = WRITE_TASKS[task_name](conn, **kwargs)
+        conn.commit()
+    finally:
+        conn.close()
+    return result
+
 def load_datasets():
     for json_file in Path(JSON_DB_DIR).glob('*.json'):
         with open(json_file, 'r') as f:
@@ -94,6 +160,12 @@ def load_datasets():
             db_path = os.path.join(SQLITE_DB_DIR, f"{data['dataset_name']}.db")
             if not os.path.exists(db_path):
                 init_sqlite_db(data['dataset_name'], json_file)
+            elif data.get('multi_annotator', False):
+                # Habilita o modo multi-anotador em uma base de dados já existente
+                conn = sqlite3.connect(db_path)
+                init_votes_table(conn.cursor())
+                conn.commit()
+                conn.close()
 
 # Verificação inicial de bases de dados e usuários
 def verify_initial_conditions():
@@ -113,6 +185,28 @@ def verify_initial_conditions():
         print(f"Or modify the json_user_dir value in the config file {CONFIG_PATH}")
         sys.exit(1)
 
+def predict_next_filepaths(c, rowid, sequential, depth, user=None):
+    """
+    Predicts the filepaths of the next samples a user will request after the sample `rowid`.
+
+    Parameters:
+    - c (sqlite3.Cursor): A cursor of the dataset database.
+    - rowid (int): The rowid of the sample that was just served.
+    - sequential (bool): If True the user is walking the dataset by id, so the next ids are
+                         predicted; otherwise the next unlabeled samples are predicted.
+    - depth (int): The number of samples to predict.
+    - user (str): In multi-annotator mode, the user whose not yet voted samples are predicted.
+    """
+    if sequential:
+        c.execute('SELECT filepath FROM samples WHERE rowid > ? AND rowid <= ?', (rowid, rowid + depth))
+    elif user is not None:
+        c.execute('''SELECT filepath FROM samples
+                     WHERE rowid > ? AND rowid NOT IN (SELECT sample_id FROM votes WHERE user = ?)
+                     LIMIT ?''', (rowid, user, depth))
+    else:
+        c.execute('SELECT filepath FROM samples WHERE label = "" AND rowid > ? LIMIT ?', (rowid, depth))
+    return [row[0] for row in c.fetchall()]
+
 # Rotas
 @app.route('/size', methods=['POST'])
 @auth_required
@@ -138,6 +232,7 @@ def obtain():
     data = request.json
     dataset_name = data.get("dataset_name")
     image_id = data.get("id")
+    user = request.authorization.username
 
     db_path = os.path.join(SQLITE_DB_DIR, f"{dataset_name}.db")
     
@@ -156,42 +251,57 @@ def obtain():
         return jsonify({"message": "Metadata not found"}), 404
     
     base_dir = base_dir_row[0]
+    multi_annotator = is_multi_annotator(c)
 
     if image_id >= 0:
-        c.execute('SELECT filepath FROM samples WHERE rowid = ?', (image_id + 1,))
+        c.execute('SELECT rowid, filepath FROM samples WHERE rowid = ?', (image_id + 1,))
+    elif multi_annotator:
+        # No modo multi-anotador, a próxima amostra ainda não votada por este usuário
+        c.execute('''SELECT rowid, filepath FROM samples
+                     WHERE rowid NOT IN (SELECT sample_id FROM votes WHERE user = ?) LIMIT 1''', (user,))
     else:
-        c.execute('SELECT filepath FROM samples WHERE label = "" LIMIT 1')
+        c.execute('SELECT rowid, filepath FROM samples WHERE label = "" LIMIT 1')
 
     sample = c.fetchone()
     
     if not sample:
         return jsonify({"message": "Sample not found"}), 404
 
+    rowid, filepath = sample
+
     # Recupera todas as labels da tabela de labels
     c.execute('SELECT label FROM labels')
     labels = [row[0] for row in c.fetchall()]
 
+    # Prevê as próximas amostras que o usuário vai pedir e as carrega em segundo plano
+    if PREFETCHER is not None and PREFETCH_DEPTH > 0:
+        next_paths = predict_next_filepaths(c, rowid, image_id >= 0, PREFETCH_DEPTH, user if multi_annotator else None)
+        PREFETCHER.schedule([os.path.join(base_dir, p) for p in next_paths])
+
     conn.close()
 
     # Monta o caminho completo da imagem
-    image_path = os.path.join(base_dir, sample[0])
-
-    # Verifica se o arquivo da imagem existe
-    if not os.path.exists(image_path):
-        return jsonify({"message": "Image file not found"}), 404
+    image_path = os.path.join(base_dir, filepath)
 
     # Determina o tipo MIME da imagem
     mime_type, _ = guess_type(image_path)
 
-    # Carrega a imagem como um arquivo binário
-    with open(image_path, 'rb') as img_file:
-        img_data = img_file.read()
+    # Carrega a imagem como um arquivo binário (a partir do cache, se habilitado).
+    # O disco só é acessado numa falha do cache; um arquivo inexistente vira 404.
+    try:
+        if IMAGE_CACHE is not None:
+            img_data = IMAGE_CACHE.read(image_path)
+        else:
+            with open(image_path, 'rb') as img_file:
+                img_data = img_file.read()
+    except FileNotFoundError:
+        return jsonify({"message": "Image file not found"}), 404
 
     # Cria o JSON com as informações desejadas
     response_json = {
         "dataset_name": dataset_name,
         "base_dir": base_dir,
-        "filepath": sample[0],
+        "filepath": filepath,
         "labels": labels  # Aqui, pegamos todas as labels da tabela
     }
 
@@ -213,24 +323,91 @@ def classify():
     if not os.path.exists(db_path):
         return jsonify({"response": False}), 404
 
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
+    try:
+        response = run_write("write_label", db_path, filepath=filepath, label=label, user=request.authorization.username)
+    except TimeoutError:
+        return jsonify({"response": False, "message": WRITE_TIMEOUT_MESSAGE}), 503
 
-    c.execute('SELECT label FROM labels WHERE label = ?', (label,))
-    if not c.fetchone():
-        return jsonify({"response": False})
+    return jsonify({"response": response})
 
-    c.execute('UPDATE samples SET label = ? WHERE filepath = ?', (label, filepath))
-    conn.commit()
+@app.route('/agreement', methods=['POST'])
+@auth_required
+def agreement():
+    data = request.json
+    dataset_name = data.get("dataset_name")
+    db_path = os.path.join(SQLITE_DB_DIR, f"{dataset_name}.db")
+
+    if not os.path.exists(db_path):
+        return jsonify({"message": "Database not found"}), 404
+
+    conn = sqlite3.connect(db_path)
+    multi_annotator = is_multi_annotator(conn.cursor())
     conn.close()
 
-    return jsonify({"response": True})
+    if not multi_annotator:
+        return jsonify({"message": "Dataset is not in multi-annotator mode"}), 400
+
+    return jsonify({"dataset_name": dataset_name, **compute_agreement(db_path)})
+
+@app.route('/import_csv', methods=['POST'])
+@auth_required
+def import_csv():
+    dataset_name = request.form.get("dataset_name")
+    overwrite = request.form.get("overwrite", "true").lower() == "true"
+    dry_run = request.form.get("dry_run", "false").lower() == "true"
+    vote_user = request.form.get("vote_user", IMPORT_USER)
+    csv_file = request.files.get("file")
+
+    db_path = os.path.join(SQLITE_DB_DIR, f"{dataset_name}.db")
+    if not os.path.exists(db_path):
+        return jsonify({"message": "Database not found"}), 404
+
+    if csv_file is None:
+        return jsonify({"message": "CSV file not found"}), 400
+
+    # Votos só em nome do próprio usuário ou de um pseudo-usuário reservado (__name__)
+    if vote_user != request.authorization.username and not is_reserved_user(vote_user):
+        return jsonify({"message": "vote_user must be your own user or a reserved name like __import__"}), 400
+
+    # Lê o CSV enviado em fluxo, sem carregá-lo inteiro na memória
+    csvfile = io.TextIOWrapper(csv_file.stream, encoding='utf-8', newline='')
+    stats = new_import_stats(overwrite, dry_run)
+    try:
+        if dry_run:
+            # Somente leitura: executado neste processo, sem passar pelo escritor
+            stats = import_csv_stream_to_db(db_path, csvfile, overwrite=overwrite, dry_run=True, vote_user=vote_user)
+        else:
+            # Um bloco por tarefa de escrita; cada bloco é confirmado antes do próximo
+            for rows in read_csv_chunks(csvfile):
+                part = run_write("write_csv_chunk", db_path, rows=rows, overwrite=overwrite, vote_user=vote_user)
+                add_import_stats(stats, part)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except TimeoutError:
+        # Os blocos já contados foram aplicados; o bloco pendente ainda pode ser aplicado
+        return jsonify({"dataset_name": dataset_name, "message": WRITE_TIMEOUT_MESSAGE, **stats}), 503
+
+    return jsonify({"dataset_name": dataset_name, **stats})
+
+@app.route('/cache_stats', methods=['POST'])
+@auth_required
+def cache_stats():
+    if IMAGE_CACHE is None:
+        return jsonify({"enabled": False})
+    if SHARED_CACHE_COUNTERS is not None:
+        # Modo multi-processo: soma dos caches de todos os processos leitores
+        return jsonify({"enabled": True, **combined_stats(SHARED_CACHE_COUNTERS, NUM_CACHES, IMAGE_CACHE.max_bytes)})
+    return jsonify({"enabled": True, **IMAGE_CACHE.stats()})
 
 def load_config_info(config_path):
     default_config = {
         "json_db_dir": os.path.expanduser("~/.config/image-label-server/json_data"),
         "sqlite_db_dir": os.path.expanduser("~/.config/image-label-server/sqlite_dbs"),
-        "json_user_dir": os.path.expanduser("~/.config/image-label-server/json_users")
+        "json_user_dir": os.path.expanduser("~/.config/image-label-server/json_users"),
+        "image_cache_mb": 256,
+        "prefetch_depth": 8,
+        "prefetch_workers": 4,
+        "sqlite_synchronous": "FULL"
     }
 
     # Se o diretório não existir, crie-o
@@ -242,7 +419,7 @@ def load_config_info(config_path):
     if not os.path.exists(config_path):
         with open(config_path, 'w') as config_file:
             json.dump(default_config, config_file, indent=4)
-        return default_config["json_db_dir"], default_config["sqlite_db_dir"], default_config["json_user_dir"]
+        return default_config
     
     # Carrega o arquivo de configuração existente
     with open(config_path, 'r') as config_file:
@@ -256,11 +433,64 @@ def load_config_info(config_path):
         with open(config_path, 'w') as config_file:
             json.dump(updated_config, config_file, indent=4)
 
-    return updated_config["json_db_dir"], updated_config["sqlite_db_dir"], updated_config["json_user_dir"]
+    return updated_config
+
+def init_image_cache(config, counters=None, offset=0, num_caches=1, claims=None):
+    global IMAGE_CACHE, PREFETCHER, PREFETCH_DEPTH
+    # O orçamento image_cache_mb é o total, dividido entre os caches dos processos
+    max_bytes = int(config["image_cache_mb"] * 1024 * 1024) // num_caches
+    if max_bytes <= 0:
+        return
+    IMAGE_CACHE = ImageCache(max_bytes, counters, offset)
+    PREFETCH_DEPTH = int(config["prefetch_depth"])
+    if PREFETCH_DEPTH > 0:
+        PREFETCHER = Prefetcher(IMAGE_CACHE, config["prefetch_workers"], claims)
+
+def init_worker(config, counters, claim_slots, num_workers, writer):
+    """
+    Initializes a reader process of the multi-process mode: all writes go to `writer` and
+    each reader has its own image cache with 1/num_workers of the image_cache_mb budget.
+    The cache counters are published in the shared array `counters` so that /cache_stats
+    reports the sum of all the readers, and the shared `claim_slots` keep two readers from
+    prefetching the same image.
+    """
+    global WRITER, SHARED_CACHE_COUNTERS, NUM_CACHES
+    WRITER = writer
+    SHARED_CACHE_COUNTERS = counters
+    NUM_CACHES = num_workers
+    init_image_cache(config, counters, writer.worker_id * len(CACHE_COUNTERS), num_workers, PrefetchClaims(claim_slots))
 
 def main():
-    global JSON_DB_DIR, SQLITE_DB_DIR, JSON_USER_DIR
-    JSON_DB_DIR, SQLITE_DB_DIR, JSON_USER_DIR = load_config_info(CONFIG_PATH)
+    global JSON_DB_DIR, SQLITE_DB_DIR, JSON_USER_DIR, CONFIG_PATH
+    EXAMPLE_USE='''
+Example of use:
+
+image-label-server
+
+image-label-server --workers 4 --port 44444
+    '''
+    
+    # Inicializa o parser
+    parser = argparse.ArgumentParser(
+        description="Server of the image labeling datasets.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=EXAMPLE_USE
+    )
+    parser.add_argument('-c', '--config', type=str, help='The path of the config file', default=CONFIG_PATH)
+    parser.add_argument('-H', '--host', type=str, help='The host address to listen on', default="0.0.0.0")
+    parser.add_argument('-p', '--port', type=int, help='The port to listen on', default=44444)
+    parser.add_argument(
+        '-w', '--workers', 
+        type=int, 
+        help='Number of reader processes sharing the socket, with all writes done by one writer process. '
+             'With 0 (default) a single process in debug mode is used', 
+        default=0
+    )
+    args = parser.parse_args()
+    
+    CONFIG_PATH = os.path.expanduser(args.config)
+    config = load_config_info(CONFIG_PATH)
+    JSON_DB_DIR, SQLITE_DB_DIR, JSON_USER_DIR = config["json_db_dir"], config["sqlite_db_dir"], config["json_user_dir"]
     
     # Carregar datasets existentes
     load_datasets()
@@ -269,7 +499,23 @@ def main():
     verify_initial_conditions()
     
     # Iniciar o servidor
-    app.run(host="0.0.0.0",port=44444, debug=True)
+    if args.workers > 0:
+        # Modo WAL: os leitores não são bloqueados pelas escritas do processo escritor
+        for db_file in Path(SQLITE_DB_DIR).glob('*.db'):
+            conn = sqlite3.connect(db_file)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.close()
+        counters = multiprocessing.RawArray('q', args.workers * len(CACHE_COUNTERS))
+        claim_slots = multiprocessing.Array('q', PREFETCH_CLAIM_SLOTS)
+        serve_multiprocess(app, args.host, args.port, args.workers, WRITE_TASKS,
+                           functools.partial(init_worker, config, counters, claim_slots, args.workers),
+                           synchronous=config["sqlite_synchronous"])
+        return
+    
+    # Cache de imagens em memória e leitura antecipada
+    init_image_cache(config)
+    
+    app.run(host=args.host,port=args.port, debug=True)
     #app.run(host="0.0.0.0",port=44444, debug=False, ssl_context=('path/to/cert.pem', 'path/to/key.pem')) # transmicion encriptada 
 
 
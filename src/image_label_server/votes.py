@@ -0,0 +1,42 @@
+# Usuário que recebe os rótulos anteriores ao modo multi-anotador
+LEGACY_USER = "__legacy__"
+
+
+def init_votes_table(c):
+    """
+    Creates the table with one vote per (sample, user) used by the multi-annotator mode.
+    In this mode the 'label' column of 'samples' holds the consensus of the votes.
+    When the table is created, the labels already in 'samples' are kept as votes of
+    LEGACY_USER, so the first vote on a labeled sample does not discard its label.
+    """
+    if is_multi_annotator(c):
+        return
+    c.execute('''CREATE TABLE IF NOT EXISTS votes (sample_id INTEGER, user TEXT, label TEXT)''')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_votes_sample_user ON votes (sample_id, user)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_votes_user ON votes (user, sample_id)''')
+    c.execute('''INSERT INTO votes SELECT rowid, ?, label FROM samples
+                 WHERE label IS NOT NULL AND label != ""''', (LEGACY_USER,))
+
+def is_reserved_user(user):
+    """
+    Returns True for the pseudo-users named like `__name__` (LEGACY_USER, the user of CSV imports,
+    model pre-labels...). Their votes count toward the consensus but they are not annotators,
+    so they are left out of the inter-annotator agreement statistics.
+    """
+    return len(user) > 4 and user.startswith("__") and user.endswith("__")
+
+def is_multi_annotator(c):
+    c.execute('SELECT name FROM sqlite_master WHERE type = "table" AND name = "votes"')
+    return c.fetchone() is not None
+
+def save_vote(c, sample_id, user, label):
+    """
+    Stores the vote of `user` for the sample `sample_id` (replacing a previous vote of the same user)
+    and updates the consensus of that sample only. The consensus is the most voted label;
+    ties are broken in favour of the label voted first.
+    """
+    c.execute('INSERT OR REPLACE INTO votes VALUES (?, ?, ?)', (sample_id, user, label))
+    c.execute('''SELECT label FROM votes WHERE sample_id = ?
+                 GROUP BY label ORDER BY COUNT(*) DESC, MIN(rowid) ASC LIMIT 1''', (sample_id,))
+    consensus = c.fetchone()[0]
+    c.execute('UPDATE samples SET label = ? WHERE rowid = ?', (consensus, sample_id))
@@ -0,0 +1,210 @@
+import os
+import sys
+import socket
+import sqlite3
+import signal
+import threading
+import itertools
+import multiprocessing
+import multiprocessing.connection
+from werkzeug.serving import make_server
+
+# Tempo máximo (s) que um leitor espera a resposta do processo escritor
+WRITE_TIMEOUT = 120
+
+# Valores aceitos para PRAGMA synchronous no processo escritor
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def open_writer_connection(db_path, synchronous="FULL"):
+    """
+    Opens the connection used by the writer process. The database is switched to WAL mode,
+    so the reader processes keep reading while the writer commits.
+
+    With synchronous="FULL" (the SQLite default) every commit is durable. "NORMAL" skips the
+    sync of each commit in WAL mode, so it is faster, but the last writes that were already
+    answered can be lost after a power failure or an OS crash (not after a crash of the process).
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA synchronous={synchronous}')
+    return conn
+
+def writer_loop(job_queue, result_conns, tasks, synchronous="FULL"):
+    """
+    Main loop of the single writer process.
+
+    Each job is a tuple (job_id, worker_id, task_name, db_path, kwargs). The task
+    `tasks[task_name](conn, **kwargs)` runs on a connection kept open per database and is
+    committed before the result is sent back through the result pipe of the worker. Exceptions
+    are rolled back and sent back as the result. A None job stops the loop.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    conns = {}
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        job_id, worker_id, task_name, db_path, kwargs = job
+        try:
+            if db_path not in conns:
+                conns[db_path] = open_writer_connection(db_path, synchronous)
+            conn = conns[db_path]
+            try:
+                result = tasks[task_name](conn, **kwargs)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        except Exception as e:
+            result = e
+        try:
+            result_conns[worker_id].send((job_id, result))
+        except Exception as e:
+            # Resultado que não pode ser serializado: envia o erro no lugar dele
+            result_conns[worker_id].send((job_id, RuntimeError(f"Unpicklable result of {task_name}: {e}")))
+    for conn in conns.values():
+        conn.close()
+
+
+class WriterClient:
+    """
+    Sends write jobs from a reader process to the writer process and waits for their results.
+
+    It is thread-safe: every request thread of the worker blocks on its own job while a
+    dispatcher thread delivers the results read from the result pipe of the worker. The pipe
+    has a single reader and a single writer, so it holds no lock that a dead reader process
+    could leave taken; the job ids carry the pid, so a restarted reader ignores the results
+    of the jobs of the process it replaced.
+    """
+    def __init__(self, job_queue, result_conn, worker_id):
+        self.job_queue = job_queue
+        self.result_conn = result_conn
+        self.worker_id = worker_id
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def _dispatch(self):
+        while True:
+            job_id, result = self.result_conn.recv()
+            with self._lock:
+                slot = self._pending.pop(job_id, None)
+            if slot is not None:
+                slot[1] = result
+                slot[0].set()
+
+    def submit(self, task_name, db_path, **kwargs):
+        """
+        Runs `task_name` on `db_path` in the writer process and returns its result.
+        An exception raised by the task is raised again here. If the writer does not answer
+        within WRITE_TIMEOUT seconds a TimeoutError is raised; the job stays queued and may
+        still be applied later.
+        """
+        with self._lock:
+            job_id = (os.getpid(), next(self._ids))
+            slot = [threading.Event(), None]
+            self._pending[job_id] = slot
+        self.job_queue.put((job_id, self.worker_id, task_name, db_path, kwargs))
+        if not slot[0].wait(WRITE_TIMEOUT):
+            with self._lock:
+                self._pending.pop(job_id, None)
+            raise TimeoutError(f"The writer process did not answer the job {task_name}")
+        if isinstance(slot[1], BaseException):
+            raise slot[1]
+        return slot[1]
+
+def reader_main(app, sock_fd, host, port, job_queue, result_conn, worker_id, init_worker):
+    """
+    Main function of a reader process: serves the Flask app on the shared listening socket.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker(WriterClient(job_queue, result_conn, worker_id))
+    server = make_server(host, port, app, threaded=True, fd=sock_fd)
+    server.serve_forever()
+
+def serve_multiprocess(app, host, port, workers, tasks, init_worker, synchronous="FULL"):
+    """
+    Serves `app` with several reader processes sharing one listening socket and a single
+    writer process that applies all the writes.
+
+    Parameters:
+    - app (flask.Flask): The WSGI application served by each reader process.
+    - host (str), port (int): The address of the listening socket.
+    - workers (int): The number of reader processes.
+    - tasks (dict): The write tasks, name -> function(conn, **kwargs), run by the writer process.
+    - init_worker (callable): Called in each reader process with its WriterClient before serving.
+    - synchronous (str): The PRAGMA synchronous of the writer connections, one of SYNCHRONOUS_MODES
+                         (see `open_writer_connection`).
+
+    Raises:
+    - ValueError: If `synchronous` is not one of SYNCHRONOUS_MODES.
+
+    The main process watches all the processes: a reader that exits is started again, and if the
+    writer exits the whole server is stopped with exit code 1, since no write could be applied.
+    The processes are created with fork, so this mode is only available on POSIX systems.
+    """
+    synchronous = str(synchronous).upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"Invalid synchronous mode {synchronous}, expected one of {SYNCHRONOUS_MODES}")
+
+    ctx = multiprocessing.get_context("fork")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    job_queue = ctx.Queue()
+    # Um pipe de resultados por leitor: (extremidade de leitura, extremidade de escrita)
+    result_pipes = [ctx.Pipe(duplex=False) for _ in range(workers)]
+
+    writer = ctx.Process(target=writer_loop, args=(job_queue, [w for r, w in result_pipes], tasks, synchronous), name="image-label-writer")
+    writer.start()
+
+    def start_reader(worker_id):
+        reader = ctx.Process(target=reader_main,
+                             args=(app, sock.fileno(), host, port, job_queue, result_pipes[worker_id][0], worker_id, init_worker),
+                             name=f"image-label-reader-{worker_id}")
+        reader.start()
+        return reader
+
+    readers = [start_reader(worker_id) for worker_id in range(workers)]
+
+    print(f"Serving on http://{host}:{port} with {workers} reader processes and 1 writer process (pid {os.getpid()})")
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    writer_died = False
+    try:
+        while True:
+            ready = multiprocessing.connection.wait([writer.sentinel] + [reader.sentinel for reader in readers])
+            if writer.sentinel in ready:
+                writer.join()
+                print(f"Error: the writer process exited with code {writer.exitcode}. The server is stopped.")
+                writer_died = True
+                break
+            for worker_id, reader in enumerate(readers):
+                if reader.sentinel in ready:
+                    reader.join()
+                    print(f"The reader process {worker_id} exited with code {reader.exitcode}. Starting it again.")
+                    readers[worker_id] = start_reader(worker_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for reader in readers:
+            reader.terminate()
+        for reader in readers:
+            reader.join()
+        job_queue.put(None)
+        writer.join(10)
+        if writer.is_alive():
+            writer.terminate()
+        sock.close()
+
+    if writer_died:
+        sys.exit(1)
@@ -22,13 +22,15 @@ setup(
     install_requires=[
         "Flask",
         "requests",
-        "pillow"
+        "pillow",
+        "numpy"
     ],
     entry_points={
         'console_scripts': [
             'image-label-server=image_label_server.server:main',
             'image-label-client=image_label_server.client:main',
             'image-label-export-csv=image_label_server.export_csv:main',
+            'image-label-import-csv=image_label_server.import_csv:main',
         ],
     },
     classifiers=[